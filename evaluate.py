@@ -12,6 +12,11 @@ import time
 from spacy.language import Language
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 def read_checkpoint(path: str):
     """Reads checkpoint file and load already processed facts"""
     if os.path.exists(path) and os.path.getsize(path) > 0:
@@ -23,6 +28,16 @@ def read_checkpoint(path: str):
     return {}
 
 
+def write_checkpoint(path: str, predictions: dict):
+    """Writes checkpoint file; it is rewritten after every fact, so orjson is used if installed"""
+    if orjson is not None:
+        with open(path, 'wb') as f:
+            f.write(orjson.dumps(predictions, option=orjson.OPT_INDENT_2))
+    else:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(predictions, f, ensure_ascii=False, indent=2)
+
+
 def resolve_context(article_ids, corpus):
     """Returns abstracts from corpus based on list of article IDs."""
     contexts = []
@@ -124,8 +139,7 @@ def main():
         record = queries[qid]
         if resp_str is None:
             predictions[qid] = None
-            with open(args.checkpoint, 'w', encoding='utf-8') as fcp:
-                json.dump(predictions, fcp, ensure_ascii=False, indent=2)
+            write_checkpoint(args.checkpoint, predictions)
             continue
         if isinstance(resp_str, dict):
             resp_json = resp_str
@@ -147,8 +161,7 @@ def main():
             coverage = len(matched) / len(norm_keywords) if norm_keywords else 0.0
             coverage_scores.append(coverage)
         predictions[qid] = {"answer": answer, "reasoning": reasoning, "coverage": coverage}
-        with open(args.checkpoint, 'w', encoding='utf-8') as fcp:
-            json.dump(predictions, fcp, ensure_ascii=False, indent=2)
+        write_checkpoint(args.checkpoint, predictions)
         with open(args.outputs, 'a', encoding='utf-8') as fout:
             fout.write(json.dumps({"prompt": prompt, "prediction": answer, "reasoning": reasoning, 'output': resp_str}, ensure_ascii=False) + '\n')
     executor.shutdown()
@@ -4,18 +4,78 @@ import dateparser
 import re
 import unicodedata
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from tqdm import tqdm 
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urljoin, unquote
 import os
 from lemmatizer import MultilingualLemmatizer
 
+try:
+    import requests_cache
+except ImportError:
+    requests_cache = None
+
+_WORD_RE = re.compile(r'\w+', flags=re.UNICODE)
+_ARTICLE_URL_RE = re.compile(r"https?://([a-z]{2})\.wikipedia\.org/wiki/(.+)")
+_ACCENT_RE = re.compile('а\u0301')
+_HEADER_RE = re.compile(r"==\s*(.*?)\s*==\s*")
+
+
+class _StripMarks(dict):
+    """str.translate() table mapping a character to its NFD form without combining marks, filled lazily."""
+
+    def __missing__(self, cp):
+        stripped = ''.join(c for c in unicodedata.normalize('NFD', chr(cp)) if not unicodedata.combining(c))
+        self[cp] = stripped
+        return stripped
+
+
+# й and ё are kept as is; every other character loses its diacritics.
+_STRIP_MARKS = _StripMarks({ord('й'): 'й', ord('ё'): 'ё'})
+
+# With requests-cache installed, API responses are cached on disk and revalidated
+# with ETag/If-None-Match, so repeated runs over the same links are near-instant.
+if requests_cache is not None:
+    SESSION = requests_cache.CachedSession(
+        'wiki_cache', expire_after=86400, cache_control=True, stale_if_error=True
+    )
+else:
+    SESSION = requests.Session()
+# Rate limiting and transient API errors are retried with exponential backoff.
+SESSION.mount('https://', HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=20,
+    max_retries=Retry(total=5, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504), raise_on_status=False),
+))
+SESSION.headers['User-Agent'] = 'wikifacts-bench/1.0 (https://github.com/kaengreg/wikifacts-bench)'
+
+# Number of articles fetched concurrently; kept low to stay polite to the Wikipedia API.
+MAX_WORKERS = 8
+
+# Seconds to wait for a connection or response before the request fails (and is retried).
+REQUEST_TIMEOUT = 30
+
+_lemmatizer = None
+
+
+def _get_lemmatizer(lang):
+    """Loads the lemmatizer once per process; it is never pickled across process boundaries."""
+    global _lemmatizer
+    if _lemmatizer is None:
+        _lemmatizer = MultilingualLemmatizer(lang)
+    return _lemmatizer
+
+
 def parse_args():
     parser = argparse.ArgumentParser()
     parser.add_argument("--input_file", type=str, default='all_facts.json', help="Raw input file path")
     parser.add_argument("--output_corpus", type=str, default="corpus.jsonl", help="Output corpus JSONL path")
     parser.add_argument("--output_queries", type=str, default="queries.jsonl", help="Output queries JSONL path")
     parser.add_argument("--lang", type=str, default='ru')
+    parser.add_argument("--abstract_only", action="store_true", help="Fetch only article intros; corpus 'text' then equals 'abstract'")
     group = parser.add_mutually_exclusive_group()
     group.add_argument("--corpus_only", action="store_true", help="Only generate corpus, skip queries")
     group.add_argument("--queries_only", action="store_true", help="Only generate queries, skip corpus")
@@ -23,26 +83,15 @@ def parse_args():
 
 
 def preprocess_text(text):
-    exclude_chars = "йё"
-    text = re.sub(r'а́', 'а', text)
-    text = re.sub(r"==\s*(.*?)\s*==\s*", r"\1 ", text)
+    text = _ACCENT_RE.sub('а', text)
+    text = _HEADER_RE.sub(r"\1 ", text)
     text = text.replace('\xa0', ' ').strip()
-    text = unicodedata.normalize('NFC', text)
-    result = []
-    for char in text:
-        if char in exclude_chars:
-            result.append(char)
-        else:
-            char_base = unicodedata.normalize('NFD', char)
-            char_without_diacritics = ''.join(
-                c for c in char_base if not unicodedata.combining(c)
-            )
-            result.append(char_without_diacritics)
-    
-    return ''.join(result)
+    if not unicodedata.is_normalized('NFC', text):
+        text = unicodedata.normalize('NFC', text)
+    return text.translate(_STRIP_MARKS)
 
-def get_wikipedia_article(link_url):
-    m = re.match(r"https?://([a-z]{2})\.wikipedia\.org/wiki/(.+)", unquote(link_url))
+def get_wikipedia_article(link_url, abstract_only=False):
+    m = _ARTICLE_URL_RE.match(unquote(link_url))
     if not m:
         return ""
 
@@ -55,7 +104,14 @@ def get_wikipedia_article(link_url):
         "format": "json",
         "titles": title
     }
-    response = requests.get(api_url, params=params)
+    if abstract_only:
+        # Only the intro section is returned, so the response is much smaller.
+        params.update({
+            "exintro": True,
+            "exsectionformat": "plain",
+            "exlimit": "max"
+        })
+    response = SESSION.get(api_url, params=params, timeout=REQUEST_TIMEOUT)
     data = response.json()
     pages = data.get('query', {}).get('pages', {})
     page = next(iter(pages.values()))
@@ -69,6 +125,75 @@ def extract_article_title(url):
 
 
 
+def fetch_all_articles(facts, processed_links, corpus_entries, cid_counter, cp_out, abstract_only=False):
+    all_urls = dict.fromkeys(
+        url for fact in facts for url in fact['links'] + fact['relevant_links'] if url
+    )
+    pending_urls = [url for url in all_urls if url not in processed_links]
+
+    # Articles are fetched concurrently; map() yields them back in link order, so ids are stable.
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        articles = executor.map(lambda url: get_wikipedia_article(url, abstract_only=abstract_only), pending_urls)
+        for url, article_text in tqdm(zip(pending_urls, articles), total=len(pending_urls), desc="Fetching articles"):
+            abstract = article_text.split('\n\n')[0]
+            cid = f"c-{cid_counter}"
+            cid_counter += 1
+            processed_links[url] = cid
+            corpus_entries[cid] = {
+                'id': cid,
+                'text': article_text,
+                'abstract': abstract,
+                'metadata': {'url': unquote(url)}
+            }
+
+            cp_out.write(json.dumps(corpus_entries[cid], ensure_ascii=False) + '\n')
+            cp_out.flush()
+
+    return cid_counter
+
+
+def emit_queries(facts, processed_links, processed_queries, qp_out, lang):
+    lemmatizer = _get_lemmatizer(lang)
+
+    for idx, fact in enumerate(tqdm(facts, desc="Processing queries")):
+        qid = f"q-{idx}"
+        if qid in processed_queries:
+            continue
+
+        linked_cids = [processed_links[url] for url in fact['links'] if url in processed_links]
+        relevant_cids = [processed_links[url] for url in fact['relevant_links'] if url in processed_links]
+
+        article_titles = [
+            extract_article_title(url)
+            for url in fact['links'] + fact['relevant_links']
+            if url in processed_links
+        ]
+
+        title_words = {
+            m.group(0)
+            for title in article_titles
+            for m in _WORD_RE.finditer(unquote(title).replace('_', ' ').lower())
+        }
+        fact_words = {m.group(0) for m in _WORD_RE.finditer(fact['text'].lower())}
+
+        normalized_title = set(lemmatizer.lemmatize_text(' '.join(title_words)).split())
+        normalized_fact = set(lemmatizer.lemmatize_text(' '.join(fact_words)).split())
+        # Sorted once here so that queries.jsonl is reproducible across runs.
+        keywords = sorted(normalized_title - normalized_fact)
+
+        entry = {
+            'id': qid,
+            'text': fact['text'],
+            'linked articles': linked_cids,
+            'relevant articles': relevant_cids,
+            'keywords': keywords,
+            'metadata': {'fact_date': fact['fact_date']}
+        }
+
+        qp_out.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        qp_out.flush()
+
+
 def main(args):
     with open(args.input_file, 'r', encoding='utf-8') as f:
         raw_data = json.load(f)
@@ -76,9 +201,10 @@ def main(args):
     facts = []
     for year, months in raw_data.items():
         for month, items in months.items():
+            # The month name is resolved once per month rather than once per fact.
+            dt_month = dateparser.parse(f"{month} {year}")
+            fact_date = dt_month.strftime("%Y-%m") if dt_month else None
             for item in items:
-                dt_month = dateparser.parse(f"{month} {year}")
-                fact_date = dt_month.strftime("%Y-%m") if dt_month else None
                 facts.append({
                     'section': item.get('section'),
                     'text': item.get('text'),
@@ -106,86 +232,27 @@ def main(args):
                     continue
 
     if not args.queries_only:
-        cp_out = open(args.output_corpus, 'a', encoding='utf-8')
-    else:
-        cp_out = None
+        with open(args.output_corpus, 'a', encoding='utf-8') as cp_out:
+            cid_counter = fetch_all_articles(
+                facts, processed_links, corpus_entries, cid_counter, cp_out,
+                abstract_only=args.abstract_only
+            )
+
+    if args.corpus_only:
+        return
 
     processed_queries = set()
-    if not args.corpus_only:
-        if os.path.exists(args.output_queries):
-            with open(args.output_queries, 'r', encoding='utf-8') as qp_file:
-                for line in qp_file:
-                    try:
-                        entry = json.loads(line)
-                        processed_queries.add(entry['id'])
-                    except Exception:
-                        continue
-        qp_out = open(args.output_queries, 'a', encoding='utf-8')
-        queries_entries = []
-    else:
-        qp_out = None
-        queries_entries = None
-
-    lemmatizer = MultilingualLemmatizer(args.lang)
-
-    for idx, fact in enumerate(tqdm(facts, desc="Processing facts and queries")):
-        if not args.queries_only:
-            for url in fact['links'] + fact['relevant_links']:
-                if url and url not in processed_links:
-                    article_text = get_wikipedia_article(url)
-                    abstract = article_text.split('\n\n')[0]
-                    cid = f"c-{cid_counter}"
-                    cid_counter += 1
-                    processed_links[url] = cid
-                    corpus_entries[cid] = {
-                        'id': cid,
-                        'text': article_text,
-                        'abstract': abstract,
-                        'metadata': {'url': unquote(url)}
-                    }
-
-                    cp_out.write(json.dumps(corpus_entries[cid], ensure_ascii=False) + '\n')
-                    cp_out.flush()
-
-        if not args.corpus_only:
-            qid = f"q-{idx}"
-            if qid not in processed_queries:
-                linked_cids = [processed_links[url] for url in fact['links'] if url in processed_links]
-                relevant_cids = [processed_links[url] for url in fact['relevant_links'] if url in processed_links]
-
-                article_titles = [
-                    extract_article_title(url)
-                    for url in fact['links'] + fact['relevant_links']
-                    if url in processed_links
-                ]
-
-                title_words = set()
-                for title in article_titles:
-                    decoded = unquote(title).replace('_', ' ')
-                    title_words.update(re.findall(r'\w+', decoded.lower(), flags=re.UNICODE))
-
-                fact_words = set(re.findall(r'\w+', fact['text'].lower(), flags=re.UNICODE))
-                normalized_title = set(lemmatizer.lemmatize_text(' '.join(title_words)).split())
-                normalized_fact = set(lemmatizer.lemmatize_text(' '.join(fact_words)).split())
-                keywords = sorted(normalized_title - normalized_fact)
-
-                entry = {
-                    'id': qid,
-                    'text': fact['text'],
-                    'linked articles': linked_cids,
-                    'relevant articles': relevant_cids,
-                    'keywords': keywords,
-                    'metadata': {'fact_date': fact['fact_date']}
-                }
-                
-                queries_entries.append(entry)
-                qp_out.write(json.dumps(entry, ensure_ascii=False) + '\n')
-                qp_out.flush()
-
-    if cp_out:
-        cp_out.close()
-    if qp_out:
-        qp_out.close()
+    if os.path.exists(args.output_queries):
+        with open(args.output_queries, 'r', encoding='utf-8') as qp_file:
+            for line in qp_file:
+                try:
+                    entry = json.loads(line)
+                    processed_queries.add(entry['id'])
+                except Exception:
+                    continue
+
+    with open(args.output_queries, 'a', encoding='utf-8') as qp_out:
+        emit_queries(facts, processed_links, processed_queries, qp_out, args.lang)
 
 
 if __name__ == "__main__":
@@ -1,23 +1,25 @@
 import os
 import re
-import json
-import requests
 import unicodedata
-from bs4 import BeautifulSoup, Tag
-from urllib.parse import urljoin, unquote
+from bs4 import BeautifulSoup
+from selectolax.lexbor import LexborHTMLParser
+from urllib.parse import urljoin
+
+from facts_jsonl import exit_if_failed, fetch_pages, open_pages, write_page, write_facts
+from wiki_session import ARTICLE_BODY, HTML_PARSER, MAX_WORKERS, REQUEST_TIMEOUT, WIKI_LINK_CSS, cached_parse, make_session, node_text, wiki_url
 
 BASE_URL = 'https://de.wikipedia.org'
 MAIN_URL = BASE_URL + '/wiki/Wikipedia:Hauptseite/Schon_gewusst/Archiv'
 
 OUTPUT_DIR = 'data/deu'
 
+SESSION = make_session()
+
 def get_month_links_from_archive(url):
-    resp = requests.get(url)
+    resp = SESSION.get(url, timeout=REQUEST_TIMEOUT)
     resp.raise_for_status()
-    soup = BeautifulSoup(resp.text, 'html.parser')
-    content = soup.find('div', class_="mw-content-ltr mw-parser-output")
-    
-    tables = content.find_all('table')
+    soup = BeautifulSoup(resp.content, HTML_PARSER, parse_only=ARTICLE_BODY, from_encoding='utf-8')
+    tables = soup.select('div.mw-content-ltr.mw-parser-output table')
     table = tables[1]
     archive = {}
 
@@ -42,24 +44,29 @@ def get_month_links_from_archive(url):
     return archive
 
 
+@cached_parse
 def parse_month_facts(month_url: str) -> list[dict]:
-    resp = requests.get(month_url)
+    resp = SESSION.get(month_url, timeout=REQUEST_TIMEOUT)
     resp.raise_for_status()
-    soup = BeautifulSoup(resp.text, "html.parser")
+    tree = LexborHTMLParser(resp.content)
 
     results = []
-    cells = soup.find_all("div", class_="hintergrundfarbe-basis")
+    cells = tree.css("div.hintergrundfarbe-basis")
     for cell in cells:
-        date_span = cell.find("span", style=lambda s: s and "font-weight:bold" in s)
-        date = date_span.text.strip() if date_span else None
+        paras = cell.css_first("p")
+        if paras is None:
+            continue
 
-        paras = cell.find("p")
-        text = " ".join(p.get_text(" ", strip=True) for p in paras)
+        date_span = cell.css_first('span[style*="font-weight:bold"]')
+        date = date_span.text().strip() if date_span else None
 
-        links = []
-        for a in paras.find_all("a", href=True):
-            if a["href"].startswith("/wiki/"):
-                links.append(unquote(urljoin(month_url, a["href"])))
+        # The text of every child of the paragraph, empty ones included, joined by a space.
+        text = " ".join(
+            node_text(p) if p.is_element_node else (p.text_content or "").strip()
+            for p in paras.iter(include_text=True)
+        )
+
+        links = [wiki_url(BASE_URL, a.attributes["href"]) for a in paras.css(WIKI_LINK_CSS)]
 
         results.append({
             "section":  str(date),
@@ -74,28 +81,41 @@ def main():
 
     archive = get_month_links_from_archive(MAIN_URL)
 
-    all_data: dict[str, dict[str, list[dict]] ] = {}
-
-    for year, months in archive.items():
-        print(f"=== {year} ===")
-        year_data: dict[str, list[dict]] = {}
-        for m in months:
+    out_path = os.path.join(OUTPUT_DIR, 'all_facts.json')
+    pages_path = out_path.replace('.json', '.jsonl')
+
+    pages_out, done_urls = open_pages(pages_path, out_path)
+    if done_urls:
+        print(f"Продолжаем прерванный запуск: {len(done_urls)} страниц уже обработано")
+
+    tasks = [(year, m) for year, months in archive.items() for m in months if m['url'] not in done_urls]
+
+    def fetch(task):
+        _, m = task
+        return parse_month_facts(m['url']) if m['exists'] else None
+
+    # Pages are fetched concurrently and yielded back in archive order.
+    failed: list[str] = []
+    with pages_out:
+        current_year = None
+        for (year, m), facts in fetch_pages(
+            fetch, tasks, pages_out, failed, MAX_WORKERS, placeholder=lambda task: (task[0], task[1]['month'])
+        ):
+            if year != current_year:
+                print(f"=== {year} ===")
+                current_year = year
             month_name = m['month']
-            print(f" Парсим {year} — {month_name}:", end=' ')
-            if m['exists']:
-                facts = parse_month_facts(m['url'])
-                print(f"{len(facts)} фактов")
-            else:
+            if facts is None:
                 facts = []
-                print("нет страницы")
-            year_data[month_name] = facts
-        all_data[year] = year_data
+                print(f" Парсим {year} — {month_name}: нет страницы")
+            else:
+                print(f" Парсим {year} — {month_name}: {len(facts)} фактов")
+            write_page(pages_out, year, month_name, facts, url=m['url'])
 
-    print(all_data)
-    out_path = os.path.join(OUTPUT_DIR, 'all_facts.json')
-    with open(out_path, 'w', encoding='utf-8') as f:
-        json.dump(all_data, f, ensure_ascii=False, indent=2)
+    exit_if_failed(failed, pages_path)
+    all_data = write_facts(pages_path, out_path)
 
+    print(all_data)
     print(f"\nГотово! Все данные записаны в {out_path}, всего собрано {sum(len(facts) for months in all_data.values() for facts in months.values())} фактов.")
 
 
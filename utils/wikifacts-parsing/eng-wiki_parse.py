@@ -1,19 +1,27 @@
 import os
 import re
-import json
-import requests
-from bs4 import BeautifulSoup, Tag
-from urllib.parse import urljoin, unquote
+from bs4 import BeautifulSoup
+from selectolax.lexbor import LexborHTMLParser
+from urllib.parse import urljoin
+
+from facts_jsonl import exit_if_failed, fetch_pages, open_pages, write_page, write_facts
+from wiki_session import ARTICLE_BODY, HTML_PARSER, MAX_WORKERS, REQUEST_TIMEOUT, WIKI_LINK_CSS, cached_parse, make_session, element_children, node_text, section_siblings, wiki_url
 
 BASE_URL = 'https://en.wikipedia.org'
 MAIN_URL = BASE_URL + '/wiki/Wikipedia:Recent_additions'
 
 OUTPUT_DIR = 'data/eng'
 
+SESSION = make_session()
+
+SECTION_CSS = 'div.mw-heading.mw-heading3'
+
+_YEAR_RE = re.compile(r'^\d{4}$')
+
 def get_month_links_from_archive(main_page_url):
-    resp = requests.get(main_page_url)
+    resp = SESSION.get(main_page_url, timeout=REQUEST_TIMEOUT)
     resp.raise_for_status()
-    soup = BeautifulSoup(resp.text, 'html.parser')
+    soup = BeautifulSoup(resp.content, HTML_PARSER, parse_only=ARTICLE_BODY, from_encoding='utf-8')
 
     container = soup.find('div', class_='floatleft')
     if not container:
@@ -28,7 +36,7 @@ def get_month_links_from_archive(main_page_url):
         if not th:
             continue
         year = th.text.strip()
-        if not re.match(r'^\d{4}$', year):
+        if not _YEAR_RE.match(year):
             continue
         
         months = []
@@ -50,39 +58,36 @@ def get_month_links_from_archive(main_page_url):
     return archive    
     
 
+@cached_parse
 def parse_month_facts(month_url: str) -> list[dict]:
-    resp = requests.get(month_url)
+    resp = SESSION.get(month_url, timeout=REQUEST_TIMEOUT)
     resp.raise_for_status()
-    soup = BeautifulSoup(resp.text, "html.parser")
+    tree = LexborHTMLParser(resp.content)
 
     results: list[dict] = []
 
-    section_divs = soup.find_all("div", class_="mw-heading mw-heading3")
-    for section_div in section_divs:
-        header = section_div.find("h3")
-        section_title = header.get_text(strip=True) if header else "(без заголовка)"
+    # Anchors inside <b> are collected once per page instead of walking up from every anchor.
+    bold_links = {a.mem_id for a in tree.css("b a[href]")}
 
-        for sib in section_div.find_next_siblings():
-            if isinstance(sib, Tag) and "mw-heading3" in sib.get("class", []):
-                break
+    section_divs = tree.css(SECTION_CSS)
+    section_content = section_siblings(section_divs, element_children, key=lambda node: node.mem_id)
+    for section_div in section_divs:
+        header = section_div.css_first("h3")
+        section_title = header.text(strip=True) if header else "(без заголовка)"
 
-            if not (isinstance(sib, Tag) and sib.name == "ul"):
+        for sib in section_content[section_div.mem_id]:
+            if sib.tag != "ul":
                 continue
 
-            for li in sib.find_all("li")[1:]:
-                fact_text = li.get_text(" ", strip=True)
-                
-                full_fact_text = "Did you know" + fact_text[3:]
+            for li in sib.css("li")[1:]:
+                fact_text = node_text(li)
+
                 links = []
                 relevant_links = []
-                for a in li.find_all("a", href=True):
-                    href = a["href"]
-                    if not href.startswith("/wiki/"):
-                        continue
-                
-                    full_url = unquote(urljoin(month_url, href))
-
-                    if a.find_parent('b'):
+                for a in li.css(WIKI_LINK_CSS):
+                    full_url = wiki_url(BASE_URL, a.attributes["href"])
+
+                    if a.mem_id in bold_links:
                         relevant_links.append(full_url)
     
                     links.append(full_url)
@@ -102,26 +107,39 @@ def main():
 
     archive = get_month_links_from_archive(MAIN_URL)
 
-    all_data: dict[str, dict[str, list[dict]] ] = {}
-
-    for year, months in archive.items():
-        print(f"=== {year} ===")
-        year_data: dict[str, list[dict]] = {}
-        for m in months:
+    out_path = os.path.join(OUTPUT_DIR, 'all_facts.json')
+    pages_path = out_path.replace('.json', '.jsonl')
+
+    pages_out, done_urls = open_pages(pages_path, out_path)
+    if done_urls:
+        print(f"Продолжаем прерванный запуск: {len(done_urls)} страниц уже обработано")
+
+    tasks = [(year, m) for year, months in archive.items() for m in months if m['url'] not in done_urls]
+
+    def fetch(task):
+        _, m = task
+        return parse_month_facts(m['url']) if m['exists'] else None
+
+    # Pages are fetched concurrently and yielded back in archive order.
+    failed: list[str] = []
+    with pages_out:
+        current_year = None
+        for (year, m), facts in fetch_pages(
+            fetch, tasks, pages_out, failed, MAX_WORKERS, placeholder=lambda task: (task[0], task[1]['month'])
+        ):
+            if year != current_year:
+                print(f"=== {year} ===")
+                current_year = year
             month_name = m['month']
-            print(f" Парсим {year} — {month_name}:", end=' ')
-            if m['exists']:
-                facts = parse_month_facts(m['url'])
-                print(f"{len(facts)} фактов")
-            else:
+            if facts is None:
                 facts = []
-                print("нет страницы")
-            year_data[month_name] = facts
-        all_data[year] = year_data
+                print(f" Парсим {year} — {month_name}: нет страницы")
+            else:
+                print(f" Парсим {year} — {month_name}: {len(facts)} фактов")
+            write_page(pages_out, year, month_name, facts, url=m['url'])
 
-    out_path = os.path.join(OUTPUT_DIR, 'all_facts.json')
-    with open(out_path, 'w', encoding='utf-8') as f:
-        json.dump(all_data, f, ensure_ascii=False, indent=2)
+    exit_if_failed(failed, pages_path)
+    all_data = write_facts(pages_path, out_path)
 
     print(f"\nГотово! Все данные записаны в {out_path}, всего собрано {sum(len(facts) for months in all_data.values() for facts in months.values())} фактов.")
 
@@ -0,0 +1,158 @@
+import os
+import sys
+import json
+import argparse
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, Optional, TextIO
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def write_page(out: TextIO, year: Optional[str], month: Optional[str], facts: list[dict], url: Optional[str] = None) -> None:
+    """
+    Appends the facts of one parsed page as a single JSONL line and flushes it.
+    A url marks the page as complete for resuming; a record with year=None only carries that mark.
+    """
+    out.write(json.dumps({'year': year, 'month': month, 'facts': facts, 'url': url}, ensure_ascii=False) + '\n')
+    out.flush()
+
+
+def open_pages(pages_path: str, out_path: str) -> tuple[TextIO, set[str]]:
+    """
+    Opens the pages JSONL file for writing and returns it with the URLs of the pages it already holds.
+    If the previous run was interrupted (the file is newer than out_path), everything up to the last
+    complete page is kept and appended to, so those pages are not fetched again; otherwise it starts empty.
+    """
+    if not os.path.exists(pages_path) or (
+        os.path.exists(out_path) and os.path.getmtime(out_path) >= os.path.getmtime(pages_path)
+    ):
+        return open(pages_path, 'w', encoding='utf-8'), set()
+
+    done_urls: set[str] = set()
+    offset = keep = 0
+    with open(pages_path, 'rb') as f:
+        for line in f:
+            offset += len(line)
+            if not line.endswith(b'\n'):
+                break
+            try:
+                url = json.loads(line).get('url')
+            except ValueError:
+                break
+            if url:
+                done_urls.add(url)
+                keep = offset
+
+    # Drops a partially written line and the records of a page that was not finished.
+    with open(pages_path, 'r+b') as f:
+        f.truncate(keep)
+    return open(pages_path, 'a', encoding='utf-8'), done_urls
+
+
+def fetch_pages(
+    fetch: Callable[[tuple[str, dict]], Optional[list[dict]]],
+    tasks: list[tuple[str, dict]],
+    pages_out: TextIO,
+    failed: list[str],
+    max_workers: int,
+    placeholder: Optional[Callable[[tuple[str, dict]], tuple[str, Optional[str]]]] = None,
+) -> Iterator[tuple[tuple[str, dict], Optional[list[dict]]]]:
+    """
+    Runs fetch over (year, page) tasks on a thread pool and yields (task, facts) back in task order.
+    A page that still fails after the session's retries is not yielded: its URL is added to failed
+    and, if placeholder maps the task to a (year, month), an empty record without URL is written
+    so the entry keeps its place in the output while the page stays pending for a resumed run.
+    """
+    def run(task):
+        try:
+            return fetch(task), None
+        except requests.RequestException as e:
+            return None, e
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for task, (facts, error) in zip(tasks, executor.map(run, tasks)):
+            if error is None:
+                yield task, facts
+                continue
+            url = task[1]['url']
+            print(f" ! {url}: {error}")
+            failed.append(url)
+            if placeholder is not None:
+                write_page(pages_out, *placeholder(task), [])
+
+
+def exit_if_failed(failed: list[str], pages_path: str) -> None:
+    """
+    Lists the pages that failed to download and exits with status 1 before all_facts.json is written,
+    so the pages file stays resumable and the next run fetches only those pages.
+    """
+    if not failed:
+        return
+    print(f"\n{len(failed)} pages failed to download:", file=sys.stderr)
+    for url in failed:
+        print(f"  {url}", file=sys.stderr)
+    print(f"Completed pages are kept in {pages_path}; re-run the script to fetch the rest.", file=sys.stderr)
+    sys.exit(1)
+
+
+def read_pages(pages_path: str) -> Iterator[dict]:
+    """Yields the page records of a JSONL file written by write_page."""
+    with open(pages_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def assemble_facts(pages_path: str, month_order: Optional[list[str]] = None) -> dict[str, dict[str, list[dict]]]:
+    """
+    Rebuilds the nested {year: {month: [facts]}} structure from a pages JSONL file.
+    Records with month=None only register the year, records with year=None are skipped.
+    If month_order is given, years are sorted and months follow that order; otherwise the
+    file order is kept.
+    """
+    all_data: dict[str, dict[str, list[dict]]] = {}
+    for page in read_pages(pages_path):
+        if page['year'] is None:
+            continue
+        year_data = all_data.setdefault(page['year'], {})
+        if page['month'] is not None:
+            year_data.setdefault(page['month'], []).extend(page['facts'])
+
+    if month_order is not None:
+        all_data = {
+            y: {m: all_data[y][m] for m in month_order if m in all_data[y]}
+            for y in sorted(all_data)
+        }
+    return all_data
+
+
+def write_facts(pages_path: str, out_path: str, month_order: Optional[list[str]] = None) -> dict[str, dict[str, list[dict]]]:
+    """Assembles the pages JSONL file and writes it as the nested all_facts.json."""
+    all_data = assemble_facts(pages_path, month_order)
+    # orjson serialises the full archive several times faster and writes UTF-8 bytes directly.
+    if orjson is not None:
+        with open(out_path, 'wb') as f:
+            f.write(orjson.dumps(all_data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+    else:
+        with open(out_path, 'w', encoding='utf-8') as f:
+            json.dump(all_data, f, ensure_ascii=False, indent=2)
+    return all_data
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build all_facts.json from a pages JSONL file.")
+    parser.add_argument("pages_path", type=str, help="JSONL file written by a *-wiki_parse.py script")
+    parser.add_argument("out_path", type=str, help="Output all_facts.json path")
+    args = parser.parse_args()
+
+    all_data = write_facts(args.pages_path, args.out_path)
+    total_facts = sum(len(facts) for months in all_data.values() for facts in months.values())
+    print(f"Done! {total_facts} facts written to {args.out_path}.")
+
+
+if __name__ == "__main__":
+    main()
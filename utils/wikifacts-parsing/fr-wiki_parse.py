@@ -1,35 +1,46 @@
 import os
 import re
-import json
-import requests
+import functools
 from typing import Any
 from collections import defaultdict
-from copy import copy
 
-from bs4 import BeautifulSoup, Tag
-from urllib.parse import urljoin, unquote
+from bs4 import BeautifulSoup
+from selectolax.lexbor import LexborHTMLParser, LexborNode
+from urllib.parse import urljoin
+
+from facts_jsonl import exit_if_failed, fetch_pages, open_pages, write_page, write_facts
+from wiki_session import ARTICLE_BODY, HTML_PARSER, MAX_WORKERS, REQUEST_TIMEOUT, WIKI_LINK_CSS, cached_parse, make_session, node_text, wiki_url
 
 BASE_URL = 'https://fr.wikipedia.org'
 MAIN_URL = BASE_URL + '/wiki/Wikip%C3%A9dia:Le_saviez-vous_%3F'
 OUTPUT_DIR = 'data/fr'
 
+SESSION = make_session()
+
 FRENCH_MONTHS = [
     'Janvier', 'Février', 'Mars', 'Avril', 'Mai', 'Juin',
     'Juillet', 'Août', 'Septembre', 'Octobre', 'Novembre', 'Décembre'
 ]
 MONTH_NUM_TO_NAME = {i + 1: name for i, name in enumerate(FRENCH_MONTHS)}
+FRENCH_MONTHS_LOWER = {m.lower(): m for m in FRENCH_MONTHS}
+
+_YEAR_RE = re.compile(r'^\d{4}$')
+_YMD_RE = re.compile(r'(\d{4})-(\d{2})-(\d{2})')
+_DMY_RE = re.compile(r'(\d{1,2})\s+(' + '|'.join(FRENCH_MONTHS) + r')\s+(\d{4})', re.IGNORECASE)
 
 
 def get_year_links_from_archive(main_page_url: str) -> dict[str, dict[str, Any]]:
     """Get the year links from the main archive page."""
-    resp = requests.get(main_page_url)
+    resp = SESSION.get(main_page_url, timeout=REQUEST_TIMEOUT)
     resp.raise_for_status()
-    soup = BeautifulSoup(resp.text, 'html.parser')
+    soup = BeautifulSoup(resp.content, HTML_PARSER, parse_only=ARTICLE_BODY, from_encoding='utf-8')
 
-    sibling_div = soup.find('div', class_='mw-heading mw-heading2 ext-discussiontools-init-section')
+    sibling_div = soup.select_one('div.mw-heading.mw-heading2.ext-discussiontools-init-section')
     if not sibling_div:
         raise ValueError("Could not find the nearest sibling div with class 'mw-heading mw-heading2 ext-discussiontools-init-section'.")
-    table = sibling_div.find_next_siblings()[1]
+    # Only the second sibling is needed, so the walk stops there instead of collecting the rest of the page.
+    siblings = sibling_div.find_next_siblings(limit=2)
+    table = siblings[1] if len(siblings) == 2 else None
     if not table:
         raise ValueError("Could not find the table.")
     p = table.find('p')
@@ -39,7 +50,7 @@ def get_year_links_from_archive(main_page_url: str) -> dict[str, dict[str, Any]]
     archive_links = {}
     for a_tag in p.find_all('a', href=True)[1:]: # skip the modifier link
         year = a_tag.text.strip()
-        if re.match(r'^\d{4}$', year):
+        if _YEAR_RE.match(year):
             href = a_tag['href']
             full_url = urljoin(BASE_URL, href)
             exists = 'new' not in a_tag.get('class', [])
@@ -51,39 +62,39 @@ def get_year_links_from_archive(main_page_url: str) -> dict[str, dict[str, Any]]
     return archive_links
 
 
-def _extract_fact_data(element: Tag, base_url: str) -> dict[str, Any]:
-    """Extracts text, links, and relevant links from a BeautifulSoup Tag."""
-    # Create a copy of the element to safely remove unwanted tags for text extraction.
-    text_element = copy(element)
-    for tag_to_remove in text_element.find_all(['figure', 'dl']):
-        tag_to_remove.decompose()
-        
-    fact_text = text_element.get_text(" ", strip=True).replace('\xa0', ' ')
+def _extract_fact_data(element: LexborNode, bold_links: set[int]) -> dict[str, Any]:
+    """
+    Extracts text, links, and relevant links from a selectolax node.
+    bold_links holds the mem_ids of the page's anchors inside <b>.
+    """
+    # Text and anchors inside <figure>/<dl> are skipped by identity, so the element is neither copied nor modified.
+    skipped = frozenset(
+        n.mem_id for t in element.css("figure, dl") for n in t.traverse(include_text=True)
+    )
+
+    # str.split() also splits on no-break spaces, so this replaces them and collapses whitespace runs in one pass.
+    fact_text = " ".join(node_text(element, skipped).split())
 
     links = []
     relevant_links = []
-    for a in element.find_all("a", href=True):
-        if a.find_parent(['figure', 'dl']):
+    for a in element.css(WIKI_LINK_CSS):
+        if a.mem_id in skipped:
             continue
 
-        href = a["href"]
-        if not href.startswith("/wiki/"):
-            continue
-
-        full_url = unquote(urljoin(base_url, href))
+        full_url = wiki_url(BASE_URL, a.attributes["href"])
 
-        if a.find_parent('b'):
+        if a.mem_id in bold_links:
             relevant_links.append(full_url)
 
         links.append(full_url)
 
-    dl_tag = element.find('dl')
+    dl_tag = element.css_first("dl")
     section_from_dl = None
     if dl_tag:
-        dl_text = dl_tag.get_text()
+        dl_text = dl_tag.text()
         
         # Format 1: YYYY-MM-DD
-        match_ymd = re.search(r'(\d{4})-(\d{2})-(\d{2})', dl_text)
+        match_ymd = _YMD_RE.search(dl_text)
         if match_ymd:
             y, m, d = match_ymd.groups()
             month_name = MONTH_NUM_TO_NAME.get(int(m))
@@ -92,11 +103,10 @@ def _extract_fact_data(element: Tag, base_url: str) -> dict[str, Any]:
         
         # Format 2: DD month_name YYYY
         else:
-            month_pattern = '|'.join(FRENCH_MONTHS)
-            match_dmy = re.search(r'(\d{1,2})\s+(' + month_pattern + r')\s+(\d{4})', dl_text, re.IGNORECASE)
+            match_dmy = _DMY_RE.search(dl_text)
             if match_dmy:
                 d, month_name, y = match_dmy.groups()
-                month_name_capitalized = next((m for m in FRENCH_MONTHS if m.lower() == month_name.lower()), month_name)
+                month_name_capitalized = FRENCH_MONTHS_LOWER.get(month_name.lower(), month_name)
                 section_from_dl = f"{int(d):02d} {month_name_capitalized} {y}"
 
     return {
@@ -107,21 +117,24 @@ def _extract_fact_data(element: Tag, base_url: str) -> dict[str, Any]:
     }
 
 
+@cached_parse
 def parse_year_facts(year_url: str, year: str) -> list[dict]:
     """Parse the facts from the year page."""
-    resp = requests.get(year_url)
+    resp = SESSION.get(year_url, timeout=REQUEST_TIMEOUT)
     resp.raise_for_status()
-    soup = BeautifulSoup(resp.text, "html.parser")
+    tree = LexborHTMLParser(resp.content)
 
     results: list[dict] = []
 
+    # Anchors inside <b> are collected once per page instead of walking up from every anchor.
+    bold_links = {a.mem_id for a in tree.css("b a[href]")}
+
     # Parse facts from all uls in section div
-    div = soup.find("div", class_="mw-content-ltr mw-parser-output")
-    uls = div.find_all("ul")
+    uls = tree.css("div.mw-content-ltr.mw-parser-output ul")
 
     for ul in uls:
-        for li in ul.find_all("li"):
-            fact_data = _extract_fact_data(li, year_url)
+        for li in ul.css("li"):
+            fact_data = _extract_fact_data(li, bold_links)
             section = fact_data.pop('section_from_dl', None) or year
             if fact_data['text']:
                 results.append({
@@ -132,14 +145,14 @@ def parse_year_facts(year_url: str, year: str) -> list[dict]:
     return results
 
 
+@functools.lru_cache(maxsize=None)
 def _extract_year_and_month_from_section(section: str) -> tuple[str, str]:
-    """Extracts year and month from the section string."""
-    month_pattern = '|'.join(FRENCH_MONTHS)
+    """Extracts year and month from the section string; memoised, since many facts share a date."""
     # Match "DD Month YYYY"
-    match_dmy = re.match(r'\d{1,2}\s+(' + month_pattern + r')\s+(\d{4})', section, re.IGNORECASE)
+    match_dmy = _DMY_RE.match(section)
     if match_dmy:
-        month, year = match_dmy.groups()
-        month_capitalized = next((m for m in FRENCH_MONTHS if m.lower() == month.lower()), month)
+        _, month, year = match_dmy.groups()
+        month_capitalized = FRENCH_MONTHS_LOWER.get(month.lower(), month)
 
         return year, month_capitalized
 
@@ -156,35 +169,45 @@ def main():
 
     archive = get_year_links_from_archive(MAIN_URL)
 
-    all_facts = []
-    for year, data in sorted(archive.items()):
-        print(f"=== {year} ===")
-        print(f" Parsing {year}:", end='')
-        if data['exists']:
-            facts = parse_year_facts(data['url'], year)
+    out_path = os.path.join(OUTPUT_DIR, 'all_facts.json')
+    pages_path = out_path.replace('.json', '.jsonl')
+
+    pages_out, done_urls = open_pages(pages_path, out_path)
+    if done_urls:
+        print(f"Resuming an interrupted run: {len(done_urls)} pages already parsed")
+
+    tasks = sorted((year, data) for year, data in archive.items() if data['url'] not in done_urls)
+
+    def fetch(task):
+        year, data = task
+        return parse_year_facts(data['url'], year) if data['exists'] else None
+
+    # Pages are fetched concurrently and yielded back in year order.
+    failed: list[str] = []
+    with pages_out:
+        for (year, data), facts in fetch_pages(fetch, tasks, pages_out, failed, MAX_WORKERS):
+            print(f"=== {year} ===")
+            print(f" Parsing {year}:", end='')
+            if facts is None:
+                print(" no page")
+                continue
+
             print(f" {len(facts)} facts")
-            all_facts.extend(facts)
-        else:
-            print(" no page")
 
-    grouped_data = defaultdict(lambda: defaultdict(list))
-    for fact in all_facts:
-        year, month = _extract_year_and_month_from_section(fact['section'])
-        grouped_data[year][month].append(fact)
+            # Facts are grouped by the date in their section, which may differ from the page year.
+            grouped_data = defaultdict(list)
+            for fact in facts:
+                grouped_data[_extract_year_and_month_from_section(fact['section'])].append(fact)
+            for (fact_year, month), month_facts in grouped_data.items():
+                write_page(pages_out, fact_year, month, month_facts)
+            # Facts may belong to other years, so the page is marked as done by a separate record.
+            write_page(pages_out, None, None, [], url=data['url'])
 
-    out_path = os.path.join(OUTPUT_DIR, 'all_facts.json')
-    with open(out_path, 'w', encoding='utf-8') as f:
-        # Sort by year, then by month index to ensure chronological order.
-        sorted_grouped_data = {
-            y: {
-                m: grouped_data[y][m]
-                for m in FRENCH_MONTHS if m in grouped_data[y]
-            }
-            for y in sorted(grouped_data.keys())
-        }
-        json.dump(sorted_grouped_data, f, ensure_ascii=False, indent=2)
+    exit_if_failed(failed, pages_path)
+    # Sort by year, then by month index to ensure chronological order.
+    all_data = write_facts(pages_path, out_path, month_order=FRENCH_MONTHS)
 
-    total_facts = len(all_facts)
+    total_facts = sum(len(facts) for months in all_data.values() for facts in months.values())
     print(f"\nDone! All data written to {out_path}, total facts collected: {total_facts}.")
 
 
@@ -1,29 +1,43 @@
 import os
 import re
-import json
-import requests
+import functools
 from typing import Any
 from collections import defaultdict
 
-from bs4 import BeautifulSoup, Tag
-from urllib.parse import urljoin, unquote
+from bs4 import BeautifulSoup
+from selectolax.lexbor import LexborHTMLParser, LexborNode
+from urllib.parse import urljoin
+
+from facts_jsonl import exit_if_failed, fetch_pages, open_pages, write_page, write_facts
+from wiki_session import ARTICLE_BODY, HTML_PARSER, MAX_WORKERS, REQUEST_TIMEOUT, WIKI_LINK_CSS, cached_parse, make_session, element_children, node_text, section_siblings, wiki_url
 
 BASE_URL = 'https://pt.wikipedia.org'
 MAIN_URL = BASE_URL + '/wiki/Wikip%C3%A9dia:Sabia_que'
 
 OUTPUT_DIR = 'data/pt'
 
+SESSION = make_session()
+
 PORTUGUESE_MONTHS = [
     'Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho',
     'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro'
 ]
 
+_YEAR_RE = re.compile(r'^\d{4}$')
+
+# One group per month, so a single scan tells which months a section title mentions.
+_MONTH_RE = re.compile(
+    r'\b(?:' + '|'.join(f'({re.escape(month)})' for month in PORTUGUESE_MONTHS) + r')\b', re.IGNORECASE
+)
+
+SECTION_CSS = "div.mw-heading.mw-heading2, div.mw-heading.mw-heading3, div.mw-heading.mw-heading4"
+
 
 def get_year_links_from_archive(main_page_url: str) -> dict[str, dict[str, Any]]:
     """Get the year links from the main archive page."""
-    resp = requests.get(main_page_url)
+    resp = SESSION.get(main_page_url, timeout=REQUEST_TIMEOUT)
     resp.raise_for_status()
-    soup = BeautifulSoup(resp.text, 'html.parser')
+    soup = BeautifulSoup(resp.content, HTML_PARSER, parse_only=ARTICLE_BODY, from_encoding='utf-8')
 
     table = soup.find('table', class_='tmbox tmbox-notice }}')
     if not table:
@@ -34,7 +48,7 @@ def get_year_links_from_archive(main_page_url: str) -> dict[str, dict[str, Any]]
         a_tag = b_tag.find('a', href=True)
         if a_tag:
             year = a_tag.text.strip()
-            if re.match(r'^\d{4}$', year):
+            if _YEAR_RE.match(year):
                 href = a_tag['href']
                 full_url = urljoin(BASE_URL, href)
                 exists = 'new' not in a_tag.get('class', [])
@@ -46,20 +60,19 @@ def get_year_links_from_archive(main_page_url: str) -> dict[str, dict[str, Any]]
     return archive_links
 
 
-def _extract_fact_data(element: Tag, base_url: str) -> dict[str, Any]:
-    """Extracts text, links, and relevant links from a BeautifulSoup Tag."""
-    fact_text = element.get_text(" ", strip=True)
+def _extract_fact_data(element: LexborNode, bold_links: set[int]) -> dict[str, Any]:
+    """
+    Extracts text, links, and relevant links from a selectolax node.
+    bold_links holds the mem_ids of the page's anchors inside <b>.
+    """
+    fact_text = node_text(element)
 
     links = []
     relevant_links = []
-    for a in element.find_all("a", href=True):
-        href = a["href"]
-        if not href.startswith("/wiki/"):
-            continue
+    for a in element.css(WIKI_LINK_CSS):
+        full_url = wiki_url(BASE_URL, a.attributes["href"])
 
-        full_url = unquote(urljoin(base_url, href))
-
-        if a.find_parent('b'):
+        if a.mem_id in bold_links:
             relevant_links.append(full_url)
 
         links.append(full_url)
@@ -82,33 +95,38 @@ def _post_process_section_title(title: str, year: str) -> str:
     return title
 
 
+@functools.lru_cache(maxsize=None)
 def _extract_month_from_section(section_title: str) -> str:
     """
     Extracts the month name from the section title, searching anywhere in the string.
-    Defaults to 'Janeiro' if no month is found.
+    Defaults to 'Janeiro' if no month is found. Results are memoised, since every fact
+    of a section shares its title.
     """
-    for month in PORTUGUESE_MONTHS:
-        if re.search(r'\b' + re.escape(month) + r'\b', section_title, re.IGNORECASE):
-            return month
-    return "Janeiro"
+    found = {match.lastindex for match in _MONTH_RE.finditer(section_title)}
+    # If several months are mentioned, the first one in calendar order wins.
+    return PORTUGUESE_MONTHS[min(found) - 1] if found else "Janeiro"
 
 
+@cached_parse
 def parse_year_facts(year_url: str, year: str) -> list[dict]:
     """Parse the facts from the year page."""
-    resp = requests.get(year_url)
+    resp = SESSION.get(year_url, timeout=REQUEST_TIMEOUT)
     resp.raise_for_status()
-    soup = BeautifulSoup(resp.text, "html.parser")
+    tree = LexborHTMLParser(resp.content)
 
     results: list[dict] = []
 
+    # Anchors inside <b> are collected once per page instead of walking up from every anchor.
+    bold_links = {a.mem_id for a in tree.css("b a[href]")}
+
     # If a wikitable exists, it's the only element with facts.
-    wikitable = soup.find("table", class_="wikitable")
+    wikitable = tree.css_first("table.wikitable")
     if wikitable:
         section_title = _post_process_section_title(str(None), year)
-        for tr in wikitable.find_all("tr")[1:]:  # Ignore header row
-            td = tr.find("td")
+        for tr in wikitable.css("tr")[1:]:  # Ignore header row
+            td = tr.css_first("td")
             if td:
-                fact_data = _extract_fact_data(td, year_url)
+                fact_data = _extract_fact_data(td, bold_links)
                 if fact_data['text']:
                     results.append({
                         "section": section_title,
@@ -117,22 +135,20 @@ def parse_year_facts(year_url: str, year: str) -> list[dict]:
         return results
 
     # Otherwise, parse facts from sections.
-    section_divs = soup.select("div.mw-heading.mw-heading2, div.mw-heading.mw-heading3, div.mw-heading.mw-heading4")
-    
+    section_divs = tree.css(SECTION_CSS)
+    section_content = section_siblings(
+        section_divs, element_children, key=lambda node: node.mem_id
+    )
+
     for section_div in section_divs:
-        header = section_div.find(["h2", "h3", "h4"])
-        raw_section_title = header.get_text(strip=True) if header else str(None)
+        header = section_div.css_first("h2, h3, h4")
+        raw_section_title = header.text(strip=True) if header else str(None)
         section_title = _post_process_section_title(raw_section_title, year)
 
-        for sib in section_div.find_next_siblings():
-            sib_classes = sib.get("class", []) if isinstance(sib, Tag) else []
-            is_heading = "mw-heading" in sib_classes and any(f"mw-heading{i}" in sib_classes for i in [2, 3, 4])
-            if is_heading:
-                break
-
+        for sib in section_content[section_div.mem_id]:
             # Some facts can be written as paragraphs
-            if isinstance(sib, Tag) and sib.name == "p":
-                fact_data = _extract_fact_data(sib, year_url)
+            if sib.tag == "p":
+                fact_data = _extract_fact_data(sib, bold_links)
                 if fact_data['text']:
                     results.append({
                         "section": section_title,
@@ -140,12 +156,12 @@ def parse_year_facts(year_url: str, year: str) -> list[dict]:
                     })
                 continue
 
-            if not (isinstance(sib, Tag) and sib.name == "ul"):
+            if sib.tag != "ul":
                 continue
 
             # Most facts are written as items in unordered lists
-            for li in sib.find_all("li"):
-                fact_data = _extract_fact_data(li, year_url)
+            for li in sib.css("li"):
+                fact_data = _extract_fact_data(li, bold_links)
                 if fact_data['text']:
                     results.append({
                         "section": section_title,
@@ -160,28 +176,43 @@ def main():
 
     archive = get_year_links_from_archive(MAIN_URL)
 
-    all_data: dict[str, dict[str, list[dict]]] = {}
-
-    for year, data in sorted(archive.items()):
-        print(f"=== {year} ===")
-        print(f" Parsing {year}:", end='')
-        if data['exists']:
-            facts = parse_year_facts(data['url'], year)
-            print(f" {len(facts)} facts")
-
-            year_data: dict[str, list[dict]] = defaultdict(list)
-            for fact in facts:
-                month_name = _extract_month_from_section(fact['section'])
-                year_data[month_name].append(fact)
-            all_data[year] = dict(year_data)
-        else:
-            facts = []
-            print(" no page")
-            all_data[year] = {}
-
     out_path = os.path.join(OUTPUT_DIR, 'all_facts.json')
-    with open(out_path, 'w', encoding='utf-8') as f:
-        json.dump(all_data, f, ensure_ascii=False, indent=2)
+    pages_path = out_path.replace('.json', '.jsonl')
+
+    pages_out, done_urls = open_pages(pages_path, out_path)
+    if done_urls:
+        print(f"Resuming an interrupted run: {len(done_urls)} pages already parsed")
+
+    tasks = sorted((year, data) for year, data in archive.items() if data['url'] not in done_urls)
+
+    def fetch(task):
+        year, data = task
+        return parse_year_facts(data['url'], year) if data['exists'] else None
+
+    # Pages are fetched concurrently and yielded back in year order.
+    failed: list[str] = []
+    with pages_out:
+        for (year, data), facts in fetch_pages(fetch, tasks, pages_out, failed, MAX_WORKERS, placeholder=lambda task: (task[0], None)):
+            print(f"=== {year} ===")
+            print(f" Parsing {year}:", end='')
+            if facts is not None:
+                print(f" {len(facts)} facts")
+
+                year_data: dict[str, list[dict]] = defaultdict(list)
+                for fact in facts:
+                    month_name = _extract_month_from_section(fact['section'])
+                    year_data[month_name].append(fact)
+            else:
+                print(" no page")
+                year_data = {}
+
+            for month_name, month_facts in year_data.items():
+                write_page(pages_out, year, month_name, month_facts)
+            # Register the year even if it has no facts; the URL marks the page as done.
+            write_page(pages_out, year, None, [], url=data['url'])
+
+    exit_if_failed(failed, pages_path)
+    all_data = write_facts(pages_path, out_path)
 
     total_facts = sum(len(facts) for months in all_data.values() for facts in months.values())
     print(f"\nDone! All data written to {out_path}, total facts collected: {total_facts}.")
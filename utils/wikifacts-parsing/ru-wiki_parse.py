@@ -1,48 +1,61 @@
 import os
 import re
-import json
-import requests
 import unicodedata
-from bs4 import BeautifulSoup, Tag
-from urllib.parse import urljoin, unquote
+from bs4 import BeautifulSoup
+from selectolax.lexbor import LexborHTMLParser
+
+from facts_jsonl import exit_if_failed, fetch_pages, open_pages, write_page, write_facts
+from wiki_session import ARTICLE_BODY, HTML_PARSER, MAX_WORKERS, REQUEST_TIMEOUT, WIKI_LINK_CSS, cached_parse, make_session, element_children, node_text, section_siblings, wiki_url
 
 BASE_URL = 'https://ru.wikipedia.org'
 MAIN_URL = BASE_URL + '/wiki/Проект:Знаете_ли_вы/Архив_рубрики'
 
 OUTPUT_DIR = 'data/rus'
 
+SESSION = make_session()
+
+SECTION_CSS = 'div.ext-discussiontools-init-section'
+
+_ARCHIVE_YEAR_RE = re.compile(r'^\d{4}\sгод[:\s]')
+_ACCENT_RE = re.compile('а\u0301')
+_HEADER_RE = re.compile(r"==\s*(.*?)\s*==\s*")
+
+
+class _StripMarks(dict):
+    """str.translate() table mapping a character to its NFD form without combining marks, filled lazily."""
+
+    def __missing__(self, cp):
+        stripped = ''.join(c for c in unicodedata.normalize('NFD', chr(cp)) if not unicodedata.combining(c))
+        self[cp] = stripped
+        return stripped
+
+
+# й and ё are kept as is; every other character loses its diacritics.
+_STRIP_MARKS = _StripMarks({ord('й'): 'й', ord('ё'): 'ё'})
+
+
 def preprocess_text(text: str) -> str:
-    exclude_chars = "йё"
-    text = re.sub(r'а́', 'а', text)
-    text = re.sub(r"==\s*(.*?)\s*==\s*", r"\1 ", text)
+    text = _ACCENT_RE.sub('а', text)
+    text = _HEADER_RE.sub(r"\1 ", text)
     text = text.replace('\xa0', ' ').strip()
-    text = unicodedata.normalize('NFC', text)
-    result = []
-    for char in text:
-        if char in exclude_chars:
-            result.append(char)
-        else:
-            base = unicodedata.normalize('NFD', char)
-            no_diacritics = ''.join(c for c in base if not unicodedata.combining(c))
-            result.append(no_diacritics)
-    return ''.join(result)
+    if not unicodedata.is_normalized('NFC', text):
+        text = unicodedata.normalize('NFC', text)
+    return text.translate(_STRIP_MARKS)
 
 
 def get_month_links_from_archive(main_page_url):
-    resp = requests.get(main_page_url)
+    resp = SESSION.get(main_page_url, timeout=REQUEST_TIMEOUT)
     resp.raise_for_status()
-    soup = BeautifulSoup(resp.text, 'html.parser')
-
-    content = soup.find('div', class_='ts-Box-description')
+    soup = BeautifulSoup(resp.content, HTML_PARSER, parse_only=ARTICLE_BODY, from_encoding='utf-8')
 
     archive_ul = None
-    for ul in content.find_all('ul'):
+    for ul in soup.select('div.ts-Box-description ul'):
         lis = ul.find_all('li', recursive=False)
 
         good = True
         for li in lis:
             bold = li.find('b')
-            if bold is None or not re.match(r'^\d{4}\sгод[:\s]', bold.text.strip()):
+            if bold is None or not _ARCHIVE_YEAR_RE.match(bold.text.strip()):
                 good = False
                 break
 
@@ -70,49 +83,47 @@ def get_month_links_from_archive(main_page_url):
     return archive
 
 
+@cached_parse
 def parse_month_facts(month_url: str) -> list[dict]:
-    resp = requests.get(month_url)
+    resp = SESSION.get(month_url, timeout=REQUEST_TIMEOUT)
     resp.raise_for_status()
-    soup = BeautifulSoup(resp.text, "html.parser")
+    tree = LexborHTMLParser(resp.content)
 
     results: list[dict] = []
 
-    section_divs = soup.find_all("div", class_="ext-discussiontools-init-section")
+    # Anchors inside <b> are collected once per page instead of walking up from every anchor.
+    bold_links = {a.mem_id for a in tree.css("b a[href]")}
 
+    section_divs = tree.css(SECTION_CSS)
+    section_content = section_siblings(
+        section_divs, element_children, key=lambda node: node.mem_id
+    )
     for section_div in section_divs:
-        header = section_div.find("h2")
-        section_title = header.get_text(strip=True) if header else "(без заголовка)"
-
-        for sib in section_div.next_siblings:
-            if isinstance(sib, Tag) and "ext-discussiontools-init-section" in sib.get("class", []):
-                break
-
-            if not isinstance(sib, Tag):
-                continue
-
-            for li in sib.find_all("li"):
-                fact_text = li.get_text(" ", strip=True)
-
-                links: list[str] = []
-                relevant_links: list[str] = []
-
-                for a in li.find_all("a", href=True):
-                    href = a["href"]
-                    if not href.startswith("/wiki/"):
-                        continue
-                
-                    full_url = unquote(urljoin(month_url, href))
-
-                    if a.find_parent('b'):
-                        relevant_links.append(full_url)
-                        
-                    links.append(full_url)
+        header = section_div.css_first("h2")
+        section_title = header.text(strip=True) if header else "(без заголовка)"
+
+        for sib in section_content[section_div.mem_id]:
+            # One pass over the sibling's anchors; each link is resolved once and handed to every
+            # enclosing <li>, since a nested item's links also belong to its parent item.
+            li_links: dict[int, list[tuple[str, bool]]] = {}
+            stop = sib.parent.mem_id
+            for a in sib.css(f"li {WIKI_LINK_CSS}"):
+                link = (wiki_url(BASE_URL, a.attributes["href"]), a.mem_id in bold_links)
+                node = a.parent
+                while node is not None and node.mem_id != stop:
+                    if node.tag == "li":
+                        li_links.setdefault(node.mem_id, []).append(link)
+                    node = node.parent
+
+            for li in sib.css("li"):
+                fact_text = node_text(li)
+                item_links = li_links.get(li.mem_id, [])
 
                 results.append({
                     "section": section_title,
                     "text": preprocess_text(fact_text),
-                    "links": links,
-                    "relevant_links": relevant_links,
+                    "links": [url for url, _ in item_links],
+                    "relevant_links": [url for url, is_bold in item_links if is_bold],
                 })
 
     return results
@@ -122,26 +133,39 @@ def main():
 
     archive = get_month_links_from_archive(MAIN_URL)
 
-    all_data: dict[str, dict[str, list[dict]] ] = {}
-
-    for year, months in archive.items():
-        print(f"=== {year} ===")
-        year_data: dict[str, list[dict]] = {}
-        for m in months:
+    out_path = os.path.join(OUTPUT_DIR, 'all_facts.json')
+    pages_path = out_path.replace('.json', '.jsonl')
+
+    pages_out, done_urls = open_pages(pages_path, out_path)
+    if done_urls:
+        print(f"Продолжаем прерванный запуск: {len(done_urls)} страниц уже обработано")
+
+    tasks = [(year, m) for year, months in archive.items() for m in months if m['url'] not in done_urls]
+
+    def fetch(task):
+        _, m = task
+        return parse_month_facts(m['url']) if m['exists'] else None
+
+    # Pages are fetched concurrently and yielded back in archive order.
+    failed: list[str] = []
+    with pages_out:
+        current_year = None
+        for (year, m), facts in fetch_pages(
+            fetch, tasks, pages_out, failed, MAX_WORKERS, placeholder=lambda task: (task[0], task[1]['month'])
+        ):
+            if year != current_year:
+                print(f"=== {year} ===")
+                current_year = year
             month_name = m['month']
-            print(f" Парсим {year} — {month_name}:", end=' ')
-            if m['exists']:
-                facts = parse_month_facts(m['url'])
-                print(f"{len(facts)} фактов")
-            else:
+            if facts is None:
                 facts = []
-                print("нет страницы")
-            year_data[month_name] = facts
-        all_data[year] = year_data
+                print(f" Парсим {year} — {month_name}: нет страницы")
+            else:
+                print(f" Парсим {year} — {month_name}: {len(facts)} фактов")
+            write_page(pages_out, year, month_name, facts, url=m['url'])
 
-    out_path = os.path.join(OUTPUT_DIR, 'all_facts.json')
-    with open(out_path, 'w', encoding='utf-8') as f:
-        json.dump(all_data, f, ensure_ascii=False, indent=2)
+    exit_if_failed(failed, pages_path)
+    all_data = write_facts(pages_path, out_path)
 
     print(f"\nГотово! Все данные записаны в {out_path}, всего собрано {sum(len(facts) for months in all_data.values() for facts in months.values())} фактов.")
 
@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import hashlib
+import inspect
+import functools
+import requests
+from bs4 import SoupStrainer
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib.parse import unquote
+
+try:
+    import requests_cache
+except ImportError:
+    requests_cache = None
+
+# The C-based lxml parser is much faster than html.parser; fall back if it is not installed.
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
+
+# Archive index links all live in the article body, so the skin (navigation, sidebars, footer)
+# is not turned into tree nodes. Pass as parse_only= when parsing an archive index page.
+# Matched by id: while parsing, a class_ filter is compared with the whole class string,
+# which is "mw-content-ltr mw-parser-output" on the content div.
+ARTICLE_BODY = SoupStrainer(id='mw-content-text')
+
+# Matches article links only, so the href prefix is checked by Lexbor instead of per anchor in Python.
+WIKI_LINK_CSS = 'a[href^="/wiki/"]'
+
+CACHE_NAME = 'wiki_cache'
+CACHE_EXPIRE_AFTER = 86400 * 7
+# Wikipedia sends max-age=0, so responses expire as soon as they are stored; they are kept this much
+# longer so a re-run can still revalidate them with If-None-Match instead of downloading them again.
+CACHE_PRUNE_AFTER = CACHE_EXPIRE_AFTER
+PARSED_CACHE_DIR = 'parsed_cache'
+
+USER_AGENT = 'wikifacts-bench/1.0 (https://github.com/kaengreg/wikifacts-bench)'
+
+# Number of archive pages fetched concurrently; kept low to stay a polite crawler.
+MAX_WORKERS = 8
+
+# Seconds to wait for a connection or response before the request fails (and is retried).
+REQUEST_TIMEOUT = 30
+
+# Rate limiting and transient server errors are retried with exponential backoff
+# (honouring Retry-After); the last response is returned so raise_for_status() still reports it.
+RETRY = Retry(
+    total=5,
+    backoff_factor=0.5,
+    status_forcelist=(429, 500, 502, 503, 504),
+    raise_on_status=False,
+)
+
+
+def _prune_http_cache(cache) -> None:
+    """
+    Deletes responses that expired more than CACHE_PRUNE_AFTER ago. This is one DELETE on the indexed
+    expires column; cache.delete(older_than=...) would deserialise every stored response instead.
+    """
+    cutoff = round(time.time()) - CACHE_PRUNE_AFTER
+    with cache.responses.connection(commit=True) as con:
+        con.execute(f'DELETE FROM {cache.responses.table_name} WHERE expires <= ?', (cutoff,))
+
+
+def make_session() -> requests.Session:
+    """
+    Creates the session used for all Wikipedia requests of a parser script.
+    Connections to the wiki host are kept alive and pooled across requests, and failed
+    requests are retried with backoff.
+    If requests-cache is installed, responses (including 404s of missing archive pages)
+    are stored in wiki_cache.sqlite and revalidated with ETag/If-None-Match, so
+    unchanged pages are not downloaded again. Responses that have been expired for longer than
+    CACHE_PRUNE_AFTER are pruned with a single SQL delete when the session is created.
+    """
+    if requests_cache is None:
+        session = requests.Session()
+    else:
+        session = requests_cache.CachedSession(
+            CACHE_NAME,
+            expire_after=CACHE_EXPIRE_AFTER,
+            cache_control=True,
+            stale_if_error=True,
+            allowable_codes=(200, 404),
+        )
+        _prune_http_cache(session.cache)
+
+    session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=20, max_retries=RETRY))
+    session.headers['User-Agent'] = USER_AGENT
+    return session
+
+
+def _prune_parsed_cache() -> None:
+    """Removes expired parsed-facts files, including those left by earlier versions of the parsers."""
+    if not os.path.isdir(PARSED_CACHE_DIR):
+        return
+    cutoff = time.time() - CACHE_EXPIRE_AFTER
+    for entry in os.scandir(PARSED_CACHE_DIR):
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            # Another parser script pruned it first.
+            pass
+
+
+def cached_parse(parse_func):
+    """
+    Caches the facts returned by a parse_*_facts(url, ...) function as JSON in
+    PARSED_CACHE_DIR, keyed by the page URL and arguments, so a re-run skips the HTML parse too.
+    Entries expire together with the HTTP cache and are invalidated whenever the
+    parser script or this module's shared helpers change; expired files are removed
+    when the parser is loaded.
+    """
+    _prune_parsed_cache()
+    script_hash = hashlib.sha1()
+    for source in (inspect.getsourcefile(parse_func), __file__):
+        with open(source, 'rb') as f:
+            script_hash.update(f.read())
+    script_hash = script_hash.hexdigest()
+
+    @functools.wraps(parse_func)
+    def wrapper(url, *args):
+        # The extra arguments are part of the key, since parsers such as parse_year_facts use them in their output.
+        call = json.dumps([url, *args], ensure_ascii=False)
+        key = hashlib.sha1(f"{script_hash}:{parse_func.__name__}:{call}".encode('utf-8')).hexdigest()
+        path = os.path.join(PARSED_CACHE_DIR, f"{key}.json")
+        if os.path.exists(path) and time.time() - os.path.getmtime(path) < CACHE_EXPIRE_AFTER:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+
+        facts = parse_func(url, *args)
+
+        os.makedirs(PARSED_CACHE_DIR, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(facts, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        return facts
+
+    return wrapper
+
+
+@functools.lru_cache(maxsize=None)
+def wiki_url(base_url: str, href: str) -> str:
+    """
+    Returns the decoded absolute URL of a /wiki/ href. The same articles are linked from
+    many facts, so results are memoised instead of re-running urljoin/unquote per anchor.
+    """
+    return unquote(base_url + href)
+
+
+# Text inside these tags is not page text; bs4's get_text() leaves it out as well.
+_NON_TEXT_TAGS = frozenset({'script', 'style'})
+
+
+def node_text(node, skip: frozenset = frozenset()) -> str:
+    """
+    Returns the text of a selectolax node the way bs4's get_text(" ", strip=True) does:
+    every text node is stripped, empty ones are dropped and the rest are joined by a space.
+    Text nodes whose mem_id is in skip are left out.
+    """
+    return " ".join(
+        text for text in (
+            n.text_content.strip() for n in node.traverse(include_text=True)
+            if n.is_text_node and n.parent.tag not in _NON_TEXT_TAGS and n.mem_id not in skip
+        ) if text
+    )
+
+
+def section_siblings(section_nodes, children, key=id) -> dict:
+    """
+    Maps every section heading (by key) to the element siblings that follow it up to the
+    next heading. Each parent's children are walked once instead of once per section, and
+    headings are recognised by key instead of re-matching the section selector per child.
+    """
+    heading_keys = {key(node) for node in section_nodes}
+    siblings = {}
+    parents = {key(node.parent): node.parent for node in section_nodes}
+    for parent in parents.values():
+        current = None
+        for child in children(parent):
+            if key(child) in heading_keys:
+                current = siblings.setdefault(key(child), [])
+            elif current is not None:
+                current.append(child)
+    return siblings
+
+
+def element_children(node):
+    """Yields the element children of a selectolax node, skipping text and comments."""
+    return (child for child in node.iter() if child.is_element_node)